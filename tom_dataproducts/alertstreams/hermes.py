@@ -2,12 +2,14 @@ import logging
 from dateutil.parser import parse
 
 from django.conf import settings
+from django.db.models import prefetch_related_objects
 
 # from hop.io import Metadata
 
 from tom_alerts.models import AlertStreamMessage
 from tom_targets.models import Target, TargetList
 from tom_dataproducts.models import ReducedDatum
+from tom_dataproducts.sharing_session import SHARING_SESSION, SHARING_TIMEOUT
 
 import requests
 
@@ -43,13 +45,17 @@ def publish_photometry_to_hermes(message_info, datums, **kwargs):
 
     hermes_photometry_data = []
     hermes_target_list = []
+    hermes_target_names = set()
     hermes_alert = AlertStreamMessage(topic=message_info.topic, exchange_status='published')
     hermes_alert.save()
+    datums = list(datums)
+    prefetch_related_objects(datums, 'target')
     for tomtoolkit_photometry in datums:
-        if tomtoolkit_photometry.target.name not in [target['name'] for target in hermes_target_list]:
+        if tomtoolkit_photometry.target.name not in hermes_target_names:
+            hermes_target_names.add(tomtoolkit_photometry.target.name)
             hermes_target_list.append(create_hermes_target_table_row(tomtoolkit_photometry.target, **kwargs))
-        tomtoolkit_photometry.message.add(hermes_alert)
         hermes_photometry_data.append(create_hermes_phot_table_row(tomtoolkit_photometry, **kwargs))
+    hermes_alert.reduceddatum_set.add(*datums)
     alert = {
         'topic': message_info.topic,
         'title': message_info.title,
@@ -63,7 +69,7 @@ def publish_photometry_to_hermes(message_info, datums, **kwargs):
         'message_text': message_info.message,
     }
 
-    response = requests.post(url=submit_url, json=alert, headers=headers)
+    response = SHARING_SESSION.post(url=submit_url, json=alert, headers=headers, timeout=SHARING_TIMEOUT)
     return response
 
 
@@ -133,10 +139,10 @@ def get_hermes_topics(**kwargs):
         submit_url = stream_base_url + "api/v0/profile/"
         headers = {'Authorization': f"Token {settings.DATA_SHARING['hermes']['HERMES_API_KEY']}"}
 
-        response = requests.get(url=submit_url, headers=headers)
+        response = SHARING_SESSION.get(url=submit_url, headers=headers, timeout=SHARING_TIMEOUT)
 
         topics = response.json()['writable_topics']
-    except (KeyError, requests.exceptions.JSONDecodeError):
+    except (KeyError, requests.exceptions.RequestException):
         topics = settings.DATA_SHARING['hermes']['USER_TOPICS']
     return topics
 
@@ -12,7 +12,8 @@ def data_product_post_upload(dp):
 
 def data_product_post_save(dps):
     """
-    This hook runs following saving a data product via the DataProductSaveView.
+    This hook runs once following saving data products via the DataProductSaveView, and receives the list of all
+    data products saved by the request.
     """
     logger.info(f'Running post save hook for DataProduct: {dps}')
 
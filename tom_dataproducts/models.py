@@ -2,13 +2,20 @@ from datetime import datetime
 import logging
 import os
 import tempfile
+from uuid import uuid4
 
 from astropy.io import fits
 from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
 from django.core.files import File
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.core.exceptions import ValidationError
 from fits2image.conversions import fits_to_jpg
+from guardian.models import GroupObjectPermission, UserObjectPermission
 from PIL import Image
 from importlib import import_module
 
@@ -23,6 +30,10 @@ try:
 except AttributeError:
     THUMBNAIL_DEFAULT_SIZE = (200, 200)
 
+# Cache key holding the current generation of cached per-user viewable target IDs used by the DataProductListView.
+# Replacing its value invalidates the cached target IDs of every user at once.
+VIEWABLE_TARGETS_CACHE_VERSION_KEY = 'dataproduct_list_viewable_targets_version'
+
 
 def find_fits_img_size(filename):
     """
@@ -383,3 +394,25 @@ class ReducedDatum(models.Model):
         obs = ReducedDatum.objects.filter(**model_dict)
         if obs:
             raise ValidationError('Data point already exists.')
+
+
+@receiver([post_save, post_delete], sender=Target)
+@receiver([post_save, post_delete], sender=UserObjectPermission)
+@receiver([post_save, post_delete], sender=GroupObjectPermission)
+def invalidate_viewable_targets_cache(sender, **kwargs):
+    """
+    Invalidates the cached viewable target IDs of all users whenever a ``Target`` or an object permission changes.
+    """
+    cache.set(VIEWABLE_TARGETS_CACHE_VERSION_KEY, uuid4().hex, None)
+
+
+@receiver(m2m_changed, sender=get_user_model().groups.through)
+@receiver(m2m_changed, sender=get_user_model().user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_viewable_targets_cache_on_m2m_change(sender, action, **kwargs):
+    """
+    Invalidates the cached viewable target IDs of all users whenever a user is added to or removed from a group, or
+    a global permission is granted to or revoked from a user or group.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_viewable_targets_cache(sender, **kwargs)
@@ -1,4 +1,3 @@
-import requests
 import os
 
 from django.conf import settings
@@ -8,6 +7,8 @@ from django.contrib import messages
 from tom_targets.models import Target
 from tom_dataproducts.models import DataProduct, ReducedDatum
 from tom_dataproducts.alertstreams.hermes import publish_photometry_to_hermes, BuildHermesMessage, get_hermes_topics
+from tom_dataproducts.sharing_session import (SHARING_SESSION, SHARING_TIMEOUT, SHARING_LOOKUP_TIMEOUT,
+                                              SHARING_UPLOAD_TIMEOUT)
 from tom_dataproducts.serializers import DataProductSerializer, ReducedDatumSerializer
 
 
@@ -104,7 +105,8 @@ def share_data_with_tom(share_destination, form_data, product_id=None, target_id
         with open(dataproduct_filename, 'rb') as dataproduct_filep:
             files = {'file': (product.data.name, dataproduct_filep, 'text/csv')}
             headers = {'Media-Type': 'multipart/form-data'}
-            response = requests.post(dataproducts_url, data=serialized_data, files=files, headers=headers, auth=auth)
+            response = SHARING_SESSION.post(dataproducts_url, data=serialized_data, files=files, headers=headers,
+                                            auth=auth, timeout=SHARING_UPLOAD_TIMEOUT)
     elif selected_data or target_id:
         # If ReducedDatums are provided, share those ReducedDatums
         if selected_data:
@@ -143,7 +145,8 @@ def share_data_with_tom(share_destination, form_data, product_id=None, target_id
                     serialized_data['source_name'] = settings.TOM_NAME
                     serialized_data['source_location'] = f"ReducedDatum shared from " \
                                                          f"<{settings.TOM_NAME}.url>/api/reduceddatums/{datum.id}/"
-                response = requests.post(reduced_datums_url, json=serialized_data, headers=headers, auth=auth)
+                response = SHARING_SESSION.post(reduced_datums_url, json=serialized_data, headers=headers, auth=auth,
+                                                timeout=SHARING_TIMEOUT)
                 response_codes.append(response.status_code)
         failed_data_count = len([rc for rc in response_codes if rc >= 300])
         if failed_data_count < len(response_codes):
@@ -168,7 +171,9 @@ def get_destination_target(target, targets_url, headers, auth):
     """
     # Create coma separated list of target names plus aliases that can be recognized and parsed by the TOM API Filter
     target_names = ','.join(map(str, target.names))
-    target_response = requests.get(f'{targets_url}?name_fuzzy={target_names}', headers=headers, auth=auth)
+    # Two results are enough to tell a unique match from an ambiguous one, so don't fetch any more than that
+    target_response = SHARING_SESSION.get(targets_url, params={'name_fuzzy': target_names, 'limit': 2},
+                                          headers=headers, auth=auth, timeout=SHARING_LOOKUP_TIMEOUT)
     target_response_json = target_response.json()
     try:
         if target_response_json['results']:
@@ -233,10 +238,11 @@ def get_sharing_destination_options():
     return tuple(choices)
 
 
-def sharing_feedback_handler(response, request):
+def get_sharing_feedback(response):
     """
-    Handle the response from a sharing request and prepare a message to the user
-    :return:
+    Extract a human-readable feedback message from the response to a sharing request
+    :param response: Response from the sharing destination, or a dictionary containing a 'message'
+    :return: Feedback message
     """
     try:
         if 'message' in response.json():
@@ -247,6 +253,15 @@ def sharing_feedback_handler(response, request):
         publish_feedback = response['message']
     except ValueError:
         publish_feedback = f"ERROR: Returned Response code {response.status_code}"
+    return publish_feedback
+
+
+def sharing_feedback_handler(response, request):
+    """
+    Handle the response from a sharing request and prepare a message to the user
+    :return:
+    """
+    publish_feedback = get_sharing_feedback(response)
     if "ERROR" in publish_feedback.upper():
         messages.error(request, publish_feedback)
     else:
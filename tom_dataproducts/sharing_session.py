@@ -0,0 +1,20 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connect and read timeouts (in seconds) for requests made to sharing destinations
+SHARING_TIMEOUT = (3.05, 30)
+# Target lookups on a destination TOM are small queries, so a slow response is treated as a failure sooner
+SHARING_LOOKUP_TIMEOUT = (3.05, 10)
+# Data product files can be large, so their uploads are given longer to complete
+SHARING_UPLOAD_TIMEOUT = (3.05, 120)
+
+# Session shared by all requests to sharing destinations, including HERMES, so that connections to a destination are
+# kept alive and reused between requests rather than re-established each time. Idempotent requests are retried on
+# gateway errors.
+SHARING_SESSION = requests.Session()
+SHARING_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+))
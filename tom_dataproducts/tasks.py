@@ -1,5 +1,6 @@
 # Place dramatiq asynchronous tasks here - they are auto-discovered
 
+from io import StringIO
 import dramatiq
 import requests
 import time
@@ -8,6 +9,9 @@ import re
 from astropy.time import Time
 from urllib.parse import urlparse
 from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management import call_command
+from django.db import transaction
 from django.utils import timezone
 from django.core.files.base import ContentFile
 
@@ -15,6 +19,8 @@ from tom_targets.models import Target
 from tom_dataproducts.models import DataProduct
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.data_processor import run_data_processor
+from tom_dataproducts.sharing import get_sharing_feedback, share_data_with_hermes, share_data_with_tom
+from tom_dataproducts.utils import assign_data_product_group_permissions
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -102,3 +108,83 @@ def atlas_query(min_date_mjd, max_date_mjd, target_id, data_product_type):
         return False
 
     return True
+
+
+@dramatiq.actor(max_retries=0, queue_name='dataproducts')
+def process_data_product(data_product_id, group_ids=None):
+    """
+    Runs the data processor on an uploaded ``DataProduct`` outside of the request/response cycle, and grants the
+    given groups access to the product and its reduced data. If processing fails, the ``DataProduct`` and any
+    ``ReducedDatum`` objects created from it are removed, mirroring the behavior of a synchronous upload.
+
+    :param data_product_id: ID of the ``DataProduct`` to process
+    :type data_product_id: int
+
+    :param group_ids: IDs of the groups to be given permission to view the processed data
+    :type group_ids: list of int
+    """
+    dp = DataProduct.objects.get(pk=data_product_id)
+    try:
+        with transaction.atomic():
+            reduced_data = run_data_processor(dp)
+            assign_data_product_group_permissions(Group.objects.filter(pk__in=group_ids or []), dp, reduced_data)
+    except Exception as e:
+        logger.error(f"Error processing uploaded data product {dp}: {repr(e)}")
+        dp.delete()
+        return False
+
+    logger.info(f"Processed uploaded data product {dp}")
+    return True
+
+
+@dramatiq.actor(max_retries=0, queue_name='sharing')
+def share_data(share_destination, form_data, product_id=None, target_id=None, selected_data=None):
+    """
+    Shares data with HERMES or another TOM outside of the request/response cycle, so that the request is not held
+    open while the data is sent to the destination. The outcome of the share is logged.
+
+    :param share_destination: HERMES topic (e.g. 'hermes:hermes.test') or TOM to share data to, as described in
+                              settings.DATA_SHARING
+    :type share_destination: str
+
+    :param form_data: Sharing form data, excluding any non-serializable values
+    :type form_data: dict
+
+    :param product_id: ID of the ``DataProduct`` to share (if provided)
+    :type product_id: int
+
+    :param target_id: ID of the ``Target`` whose data is to be shared (if provided)
+    :type target_id: int
+
+    :param selected_data: IDs of the ``ReducedDatum`` objects to share (if provided)
+    :type selected_data: list
+    """
+    if 'HERMES' in share_destination.upper():
+        response = share_data_with_hermes(share_destination, form_data, product_id, target_id, selected_data)
+    else:
+        response = share_data_with_tom(share_destination, form_data, product_id, target_id, selected_data)
+    publish_feedback = get_sharing_feedback(response)
+    if 'ERROR' in publish_feedback.upper():
+        logger.error(f"Sharing data with {share_destination} failed: {publish_feedback}")
+        return False
+
+    logger.info(f"Shared data with {share_destination}: {publish_feedback}")
+    return True
+
+
+@dramatiq.actor(max_retries=0, queue_name='dataproducts')
+def update_reduced_data(target_id=None):
+    """
+    Runs the ``updatereduceddata`` management command outside of the request/response cycle, as fetching new data
+    from brokers can take a long time. The output of the command is logged.
+
+    :param target_id: ID of the ``Target`` to update the reduced data of. If omitted, all targets are updated.
+    :type target_id: int
+    """
+    out = StringIO()
+    if target_id:
+        call_command('updatereduceddata', target_id=target_id, stdout=out)
+    else:
+        call_command('updatereduceddata', stdout=out)
+    logger.info(out.getvalue())
+    return out.getvalue()
@@ -7,22 +7,27 @@ from astropy import units
 from astropy.io import fits
 from astropy.table import Table
 from datetime import date, time
-from django.test import TestCase, override_settings
+from django.test import TestCase, TransactionTestCase, modify_settings, override_settings
 from django.conf import settings
-from django.contrib.auth.models import Group, User
+from django.contrib.auth.models import Group, Permission, User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Model
 from django.urls import reverse
 from guardian.shortcuts import assign_perm
 import numpy as np
 from specutils import Spectrum1D
 from unittest.mock import patch
 
+from tom_alerts.models import AlertStreamMessage
+from tom_dataproducts.alertstreams.hermes import BuildHermesMessage, publish_photometry_to_hermes
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import DataProductUploadForm
-from tom_dataproducts.models import DataProduct, is_fits_image_file, ReducedDatum, data_product_path
+from tom_dataproducts.models import (DataProduct, DataProductGroup, is_fits_image_file, ReducedDatum,
+                                     data_product_path)
 from tom_dataproducts.processors.data_serializers import SpectrumSerializer
 from tom_dataproducts.processors.photometry_processor import PhotometryProcessor
 from tom_dataproducts.processors.spectroscopy_processor import SpectroscopyProcessor
+from tom_dataproducts.tasks import process_data_product, share_data
 from tom_dataproducts.utils import create_image_dataproduct
 from tom_observations.tests.utils import FakeRoboticFacility
 from tom_observations.tests.factories import SiderealTargetFactory, ObservingRecordFactory
@@ -44,6 +49,10 @@ def dp_path(instance, filename):
     return f'new_path/{filename}'
 
 
+# Lets django_dramatiq be added to INSTALLED_APPS in tests without connecting to a real broker
+STUB_DRAMATIQ_BROKER = {'BROKER': 'dramatiq.brokers.stub.StubBroker', 'OPTIONS': {}, 'MIDDLEWARE': []}
+
+
 @override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
                    TARGET_PERMISSIONS_ONLY=True)
 @patch('tom_dataproducts.models.DataProduct.get_preview', return_value='/no-image.jpg')
@@ -84,6 +93,44 @@ class Views(TestCase):
             self.assertTrue(mock.called)
             self.assertContains(response, 'Successfully saved: afile.fits')
 
+    def test_feature_dataproduct(self, dp_mock):
+        previously_featured = DataProduct.objects.create(
+            product_id='featuredproductid',
+            target=self.target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata'),
+            featured=True
+        )
+        response = self.client.get(
+            reverse('dataproducts:feature', kwargs={'pk': self.data_product.id}) + f'?target_id={self.target.id}'
+        )
+        self.assertRedirects(response, reverse('tom_targets:detail', kwargs={'pk': self.target.id}),
+                             fetch_redirect_response=False)
+        self.data_product.refresh_from_db()
+        previously_featured.refresh_from_db()
+        self.assertTrue(self.data_product.featured)
+        self.assertFalse(previously_featured.featured)
+
+    def test_remove_dataproducts_from_group(self, dp_mock):
+        group = DataProductGroup.objects.create(name='testgroup')
+        group.dataproduct_set.add(self.data_product)
+        response = self.client.post(
+            reverse('dataproducts:group-detail', kwargs={'pk': group.id}),
+            data={'products': [self.data_product.id]}
+        )
+        self.assertRedirects(response, reverse('dataproducts:group-detail', kwargs={'pk': group.id}),
+                             fetch_redirect_response=False)
+        self.assertFalse(group.dataproduct_set.exists())
+
+    @patch('tom_dataproducts.tasks.call_command')
+    def test_update_reduced_data(self, call_command_mock, dp_mock):
+        response = self.client.get(
+            reverse('dataproducts:update-reduced-data') + f'?target_id={self.target.id}',
+            HTTP_REFERER=reverse('tom_targets:detail', kwargs={'pk': self.target.id})
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        call_command_mock.assert_called_once()
+        self.assertEqual(call_command_mock.call_args.kwargs['target_id'], str(self.target.id))
+
     # Non-FITS file
     def test_is_fits_image_file_invalid_fits(self, dp_mock):
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -253,9 +300,9 @@ class TestDataProductListView(TestCase):
             target=self.target,
             data=SimpleUploadedFile('afile.fits', b'somedata')
         )
-        user = User.objects.create_user(username='test', email='test@example.com')
-        assign_perm('tom_targets.view_target', user, self.target)
-        self.client.force_login(user)
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        assign_perm('tom_targets.view_target', self.user, self.target)
+        self.client.force_login(self.user)
 
     @patch('tom_dataproducts.models.DataProduct.get_preview', return_value='/no-image.jpg')
     def test_dataproduct_list(self, dp_mock):
@@ -263,6 +310,69 @@ class TestDataProductListView(TestCase):
         response = self.client.get(reverse('tom_dataproducts:list'))
         self.assertContains(response, 'afile.fits')
 
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('tom_dataproducts.models.DataProduct.get_preview', return_value='/no-image.jpg')
+    def test_dataproduct_list_permission_change(self, dp_mock):
+        """Test that cached viewable targets are invalidated when target permissions change."""
+        other_target = SiderealTargetFactory.create()
+        DataProduct.objects.create(
+            product_id='otherproductid',
+            target=other_target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertNotContains(response, 'bfile.fits')
+        assign_perm('tom_targets.view_target', self.user, other_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertContains(response, 'bfile.fits')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('tom_dataproducts.models.DataProduct.get_preview', return_value='/no-image.jpg')
+    def test_dataproduct_list_group_membership_change(self, dp_mock):
+        """Test that cached viewable targets are invalidated when a user joins or leaves a group."""
+        other_target = SiderealTargetFactory.create()
+        DataProduct.objects.create(
+            product_id='otherproductid',
+            target=other_target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+        group = Group.objects.create(name='permitted')
+        assign_perm('tom_targets.view_target', group, other_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertNotContains(response, 'bfile.fits')
+        self.user.groups.add(group)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertContains(response, 'bfile.fits')
+        group.user_set.remove(self.user)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertNotContains(response, 'bfile.fits')
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    @patch('tom_dataproducts.models.DataProduct.get_preview', return_value='/no-image.jpg')
+    def test_dataproduct_list_global_permission_change(self, dp_mock):
+        """Test that cached viewable targets are invalidated when a global permission is granted or revoked."""
+        other_target = SiderealTargetFactory.create()
+        DataProduct.objects.create(
+            product_id='otherproductid',
+            target=other_target,
+            data=SimpleUploadedFile('bfile.fits', b'somedata')
+        )
+        view_target = Permission.objects.get(content_type__app_label='tom_targets', codename='view_target')
+        group = Group.objects.create(name='permitted')
+        group.user_set.add(self.user)
+        group.permissions.add(view_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertContains(response, 'bfile.fits')
+        group.permissions.remove(view_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertNotContains(response, 'bfile.fits')
+        self.user.user_permissions.add(view_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertContains(response, 'bfile.fits')
+        self.user.user_permissions.remove(view_target)
+        response = self.client.get(reverse('tom_dataproducts:list'))
+        self.assertNotContains(response, 'bfile.fits')
+
     @patch('tom_dataproducts.models.is_fits_image_file')
     def test_dataproduct_list_no_thumbnail(self, mock_is_fits_image_file):
         """Test that a data product with a failed thumbnail creation does not raise an exception."""
@@ -326,6 +436,121 @@ class TestUploadDataProducts(TestCase):
             self.target.name, FakeRoboticFacility.name)
         )
 
+    def test_upload_data_invalid_file_format(self, run_data_processor_mock):
+        run_data_processor_mock.side_effect = InvalidFileFormatException('bad file')
+        response = self.client.post(
+            reverse('dataproducts:upload'),
+            {
+                'facility': 'LCO',
+                'files': SimpleUploadedFile('cfile.fits', b'afile'),
+                'target': self.target.id,
+                'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                'observation_timestamp_0': date(2019, 6, 1),
+                'observation_timestamp_1': time(12, 0, 0),
+                'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+            },
+            follow=True
+        )
+        self.assertContains(response, 'File format invalid for file {0}/none/cfile.fits'.format(self.target.name))
+        self.assertFalse(DataProduct.objects.filter(data__endswith='cfile.fits').exists())
+
+    @override_settings(TARGET_PERMISSIONS_ONLY=False, DRAMATIQ_BROKER=STUB_DRAMATIQ_BROKER)
+    @modify_settings(INSTALLED_APPS={'append': 'django_dramatiq'})
+    @patch('tom_dataproducts.views.process_data_product.send')
+    def test_upload_data_queued(self, send_mock, run_data_processor_mock):
+        group = Group.objects.create(name='permitted')
+        group.user_set.add(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('dataproducts:upload'),
+                {
+                    'facility': 'LCO',
+                    'files': SimpleUploadedFile('dfile.fits', b'afile'),
+                    'target': self.target.id,
+                    'groups': [group.id],
+                    'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                    'observation_timestamp_0': date(2019, 6, 1),
+                    'observation_timestamp_1': time(12, 0, 0),
+                    'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+                },
+                follow=True
+            )
+        dp = DataProduct.objects.get(data__endswith='dfile.fits')
+        send_mock.assert_called_once_with(dp.id, [group.id])
+        run_data_processor_mock.assert_not_called()
+        self.assertContains(response, 'Queued for processing: {0}/none/dfile.fits'.format(self.target.name))
+
+
+@override_settings(TOM_FACILITY_CLASSES=['tom_observations.tests.utils.FakeRoboticFacility'],
+                   TARGET_PERMISSIONS_ONLY=True, DRAMATIQ_BROKER=STUB_DRAMATIQ_BROKER)
+@modify_settings(INSTALLED_APPS={'append': 'django_dramatiq'})
+class TestQueueUploadedDataProducts(TransactionTestCase):
+    """
+    Runs outside a test transaction, so that on_commit callbacks run when the upload is committed, as they do without
+    ATOMIC_REQUESTS.
+    """
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        assign_perm('tom_targets.view_target', self.user, self.target)
+        self.client.force_login(self.user)
+
+    @patch('tom_dataproducts.views.process_data_product.send', side_effect=ConnectionError('broker unavailable'))
+    def test_upload_data_queue_failure(self, send_mock):
+        response = self.client.post(
+            reverse('dataproducts:upload'),
+            {
+                'files': SimpleUploadedFile('efile.fits', b'afile'),
+                'target': self.target.id,
+                'data_product_type': settings.DATA_PRODUCT_TYPES['spectroscopy'][0],
+                'referrer': reverse('targets:detail', kwargs={'pk': self.target.id})
+            },
+            follow=True
+        )
+        send_mock.assert_called_once()
+        self.assertContains(response, 'There was a problem processing your file: {0}/none/efile.fits'.format(
+            self.target.name)
+        )
+        self.assertNotContains(response, 'Queued for processing')
+        self.assertFalse(DataProduct.objects.filter(data__endswith='efile.fits').exists())
+
+
+@override_settings(TARGET_PERMISSIONS_ONLY=False)
+class TestProcessDataProductTask(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.data_product = DataProduct.objects.create(
+            product_id='testproductid',
+            target=self.target,
+            data=SimpleUploadedFile('afile.fits', b'somedata')
+        )
+        self.group = Group.objects.create(name='permitted')
+        self.user = User.objects.create_user(username='test', email='test@example.com')
+        self.group.user_set.add(self.user)
+
+    @patch('tom_dataproducts.tasks.run_data_processor', return_value=ReducedDatum.objects.none())
+    def test_process_data_product_assigns_group_permissions(self, run_data_processor_mock):
+        self.assertTrue(process_data_product(self.data_product.id, [self.group.id]))
+        self.assertTrue(self.user.has_perm('tom_dataproducts.view_dataproduct', self.data_product))
+        self.assertTrue(self.user.has_perm('tom_dataproducts.delete_dataproduct', self.data_product))
+
+    def test_process_data_product_assigns_reduced_datum_group_permissions(self):
+        datum = ReducedDatum.objects.create(
+            target=self.target,
+            data_product=self.data_product,
+            data_type='photometry',
+            value={'magnitude': 18.5, 'error': .5, 'filter': 'V'}
+        )
+        with patch('tom_dataproducts.tasks.run_data_processor',
+                   return_value=ReducedDatum.objects.filter(data_product=self.data_product)):
+            self.assertTrue(process_data_product(self.data_product.id, [self.group.id]))
+        self.assertTrue(self.user.has_perm('tom_dataproducts.view_reduceddatum', datum))
+
+    @patch('tom_dataproducts.tasks.run_data_processor', side_effect=InvalidFileFormatException('bad file'))
+    def test_process_data_product_invalid_file(self, run_data_processor_mock):
+        self.assertFalse(process_data_product(self.data_product.id, [self.group.id]))
+        self.assertFalse(DataProduct.objects.filter(pk=self.data_product.id).exists())
+
 
 class TestDeleteDataProducts(TestCase):
     def setUp(self):
@@ -703,6 +928,62 @@ class TestShareDataProducts(TestCase):
         )
         self.assertContains(response, 'Data product successfully uploaded.')
 
+    @responses.activate
+    def test_share_data_task_valid_target_found(self):
+        share_destination = 'local_host'
+        destination_tom_base_url = settings.DATA_SHARING[share_destination]['BASE_URL']
+
+        responses.add(
+            responses.GET,
+            destination_tom_base_url + 'api/targets/',
+            json={"results": [{'id': 1}]},
+            status=200
+        )
+        responses.add(
+            responses.POST,
+            destination_tom_base_url + 'api/dataproducts/',
+            json={"message": "Data product successfully uploaded."},
+            status=200,
+        )
+
+        self.assertTrue(share_data(share_destination, {}, product_id=self.data_product.id))
+
+    @override_settings(DRAMATIQ_BROKER=STUB_DRAMATIQ_BROKER)
+    @modify_settings(INSTALLED_APPS={'append': 'django_dramatiq'})
+    @patch('tom_dataproducts.views.share_data.send')
+    def test_share_reduced_datums_queued(self, send_mock):
+        share_destination = 'local_host'
+        response = self.client.post(
+            reverse('dataproducts:share_all', kwargs={'tg_pk': self.target.id}),
+            {
+                'share_authors': ['test_author'],
+                'target': self.target.id,
+                'submitter': ['test_submitter'],
+                'share_destination': [share_destination],
+                'share_title': ['Updated data for thingy.'],
+                'share_message': ['test_message'],
+                'share-box': [self.rd1.id, self.rd2.id]
+            },
+            follow=True
+        )
+        send_mock.assert_called_once_with(
+            share_destination,
+            {
+                'share_destination': share_destination,
+                'share_title': 'Updated data for thingy.',
+                'share_message': 'test_message',
+                'share_authors': 'test_author',
+                'data_type': '',
+                'submitter': 'test_submitter'
+            },
+            None,
+            self.target.id,
+            [str(self.rd1.id), str(self.rd2.id)]
+        )
+        form_data = send_mock.call_args.args[1]
+        self.assertFalse(any(isinstance(value, Model) for value in form_data.values()))
+        self.assertContains(response, f'Sharing data with {share_destination} has been queued.')
+
     @responses.activate
     def test_share_reduceddatums_target_valid_responses(self):
         share_destination = 'local_host'
@@ -851,3 +1132,37 @@ class TestShareDataProducts(TestCase):
             follow=True
         )
         self.assertContains(response, 'No valid data shared. These data may already exist in target TOM.')
+
+
+@override_settings(DATA_SHARING={'hermes': {'BASE_URL': 'https://fake.hermes/',
+                                            'HERMES_API_KEY': 'fake_key'}})
+@patch('tom_dataproducts.sharing_session.SHARING_SESSION.post')
+class TestPublishPhotometryToHermes(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create()
+        self.other_target = SiderealTargetFactory.create()
+        self.datums = [
+            ReducedDatum.objects.create(
+                target=target,
+                data_type='photometry',
+                value={'magnitude': magnitude, 'error': .5, 'filter': 'V'}
+            )
+            for target, magnitude in [(self.target, 18.5), (self.target, 19.5), (self.other_target, 17.5)]
+        ]
+        self.message_info = BuildHermesMessage(title='Test', submitter='test_submitter', topic='hermes.test')
+
+    def test_publish_photometry_to_hermes(self, post_mock):
+        publish_photometry_to_hermes(self.message_info, self.datums)
+        post_mock.assert_called_once()
+        alert_data = post_mock.call_args.kwargs['json']['data']
+        self.assertCountEqual([row['name'] for row in alert_data['targets']],
+                              [self.target.name, self.other_target.name])
+        self.assertEqual(len(alert_data['photometry']), len(self.datums))
+        hermes_alert = AlertStreamMessage.objects.get(topic='hermes.test')
+        self.assertCountEqual(hermes_alert.reduceddatum_set.all(), self.datums)
+
+    def test_publish_photometry_to_hermes_queryset(self, post_mock):
+        publish_photometry_to_hermes(self.message_info, ReducedDatum.objects.filter(target=self.target))
+        alert_data = post_mock.call_args.kwargs['json']['data']
+        self.assertEqual([row['name'] for row in alert_data['targets']], [self.target.name])
+        self.assertEqual(len(alert_data['photometry']), 2)
@@ -1,8 +1,15 @@
+from functools import lru_cache
 import os
 
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
 from django.core.files import File
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from guardian.models import GroupObjectPermission
+from guardian.shortcuts import assign_perm
 
-from .models import DataProduct
+from .models import DataProduct, ReducedDatum
 
 
 def create_image_dataproduct(data_product):
@@ -32,3 +39,59 @@ def create_image_dataproduct(data_product):
         return True
 
     return
+
+
+@lru_cache(maxsize=None)
+def get_object_permission(model, codename):
+    """
+    Gets the ``Permission`` with the given codename for a model. The result is cached, as permissions only change when
+    migrations are run.
+
+    :param model: Model class the permission applies to
+    :type model: class
+
+    :param codename: Codename of the permission, e.g. 'view_dataproduct'
+    :type codename: str
+
+    :returns: Permission, with its content type already loaded
+    :rtype: Permission
+    """
+    content_type = ContentType.objects.get_for_model(model)
+    return Permission.objects.select_related('content_type').get(content_type=content_type, codename=codename)
+
+
+@receiver(post_migrate)
+def clear_object_permission_cache(sender, **kwargs):
+    """
+    Clears cached permissions whenever migrations are run, as that may recreate permissions with new IDs.
+    """
+    get_object_permission.cache_clear()
+
+
+def assign_data_product_group_permissions(groups, data_product, reduced_data):
+    """
+    Gives a set of groups permission to view and delete a ``DataProduct``, and to view the ``ReducedDatum`` objects
+    that were created from it. Permissions are created in bulk rather than with one query per group and object.
+
+    :param groups: Groups to be given permissions
+    :type groups: QuerySet of Group
+
+    :param data_product: ``DataProduct`` the groups are given access to
+    :type data_product: DataProduct
+
+    :param reduced_data: ``ReducedDatum`` objects the groups are given access to
+    :type reduced_data: QuerySet of ReducedDatum
+    """
+    if not groups:
+        return
+    assign_perm(get_object_permission(DataProduct, 'view_dataproduct'), groups, data_product)
+    assign_perm(get_object_permission(DataProduct, 'delete_dataproduct'), groups, data_product)
+
+    view_reduceddatum = get_object_permission(ReducedDatum, 'view_reduceddatum')
+    GroupObjectPermission.objects.bulk_create(
+        [GroupObjectPermission(group=group, permission=view_reduceddatum, content_type=view_reduceddatum.content_type,
+                               object_pk=str(datum.pk))
+         for group in groups for datum in reduced_data],
+        batch_size=500,
+        ignore_conflicts=True
+    )
@@ -1,6 +1,7 @@
-from io import StringIO
+from functools import partial
 import logging
 from urllib.parse import urlencode, urlparse
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib import messages
@@ -8,22 +9,23 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import Group
 from django.core.cache import cache
 from django.core.cache.utils import make_template_fragment_key
-from django.core.management import call_command
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.views.generic import View, ListView
 from django.views.generic.base import RedirectView
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, FormView
 from django_filters.views import FilterView
-from guardian.shortcuts import assign_perm, get_objects_for_user
+from guardian.shortcuts import get_objects_for_user
 
 from tom_common.hooks import run_hook
 from tom_common.hints import add_hint
 from tom_common.mixins import Raise403PermissionRequiredMixin
-from tom_dataproducts.models import DataProduct, DataProductGroup, ReducedDatum
+from tom_dataproducts.models import DataProduct, DataProductGroup, ReducedDatum, VIEWABLE_TARGETS_CACHE_VERSION_KEY
 from tom_dataproducts.exceptions import InvalidFileFormatException
 from tom_dataproducts.forms import AddProductToGroupForm, DataProductUploadForm, DataShareForm
 from tom_dataproducts.filters import DataProductFilter
@@ -31,6 +33,8 @@ from tom_dataproducts.data_processor import run_data_processor
 from tom_observations.models import ObservationRecord
 from tom_observations.facility import get_service_class
 from tom_dataproducts.sharing import share_data_with_hermes, share_data_with_tom, sharing_feedback_handler
+from tom_dataproducts.tasks import process_data_product, share_data, update_reduced_data
+from tom_dataproducts.utils import assign_data_product_group_permissions
 import tom_dataproducts.forced_photometry.forced_photometry_service as fps
 from tom_targets.models import Target
 
@@ -51,29 +55,26 @@ class DataProductSaveView(LoginRequiredMixin, View):
         :param request: Django POST request object
         :type request: HttpRequest
         """
-        service_class = get_service_class(request.POST['facility'])
+        facility = get_service_class(request.POST['facility'])()
         observation_record = ObservationRecord.objects.get(pk=kwargs['pk'])
         products = request.POST.getlist('products')
         if not products:
             messages.warning(request, 'No products were saved, please select at least one dataproduct')
         elif products[0] == 'ALL':
-            products = service_class().save_data_products(observation_record)
+            products = facility.save_data_products(observation_record)
             messages.success(request, 'Saved all available data products')
         else:
             total_saved_products = []
             for product in products:
-                saved_products = service_class().save_data_products(
+                total_saved_products += facility.save_data_products(
                     observation_record,
                     product
                 )
-                total_saved_products += saved_products
-                run_hook('data_product_post_save', saved_products)
-                messages.success(
-                    request,
-                    'Successfully saved: {0}'.format('\n'.join(
-                        [str(p) for p in saved_products]
-                    ))
-                )
+            run_hook('data_product_post_save', total_saved_products)
+            messages.success(
+                request,
+                'Successfully saved: {0}'.format('\n'.join([str(p) for p in total_saved_products]))
+            )
             run_hook('multiple_data_products_post_save', total_saved_products)
         return redirect(reverse(
             'tom_observations:detail',
@@ -176,10 +177,23 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
                 form.fields['groups'].queryset = self.request.user.groups.all()
         return form
 
+    def send_for_processing(self, data_product, group_ids):
+        """
+        Sends a saved ``DataProduct`` to the ``process_data_product`` task. If the task can't be sent, the
+        ``DataProduct`` is deleted, as it would otherwise be left unprocessed and without its group permissions.
+        """
+        try:
+            process_data_product.send(data_product.id, group_ids)
+        except Exception:
+            logger.exception(f'Failed to queue processing for data product {data_product.id}')
+            data_product.delete()
+            raise
+
     def form_valid(self, form):
         """
         Runs after ``DataProductUploadForm`` is validated. Saves each ``DataProduct`` and calls ``run_data_processor``
-        on each saved file. Redirects to the previous page.
+        on each saved file. If ``django_dramatiq`` is installed, processing is queued as a background task rather than
+        run during the request. Redirects to the previous page.
         """
         target = form.cleaned_data['target']
         if not target:
@@ -188,8 +202,13 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
         else:
             observation_record = None
         dp_type = form.cleaned_data['data_product_type']
+        groups = Group.objects.none() if settings.TARGET_PERMISSIONS_ONLY else form.cleaned_data['groups']
+        # With a task queue, processing of each file is sent to a worker once the upload is committed
+        queue_processing = 'django_dramatiq' in settings.INSTALLED_APPS
+        group_ids = [group.id for group in groups] if queue_processing else []
         data_product_files = self.request.FILES.getlist('files')
         successful_uploads = []
+        queued_uploads = []
         for f in data_product_files:
             dp = DataProduct(
                 target=target,
@@ -198,31 +217,39 @@ class DataProductUploadView(LoginRequiredMixin, FormView):
                 product_id=None,
                 data_product_type=dp_type
             )
-            dp.save()
             try:
-                run_hook('data_product_post_upload', dp)
-                reduced_data = run_data_processor(dp)
-                if not settings.TARGET_PERMISSIONS_ONLY:
-                    for group in form.cleaned_data['groups']:
-                        assign_perm('tom_dataproducts.view_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.delete_dataproduct', group, dp)
-                        assign_perm('tom_dataproducts.view_reduceddatum', group, reduced_data)
-                successful_uploads.append(str(dp))
+                # A failure rolls back the DataProduct along with any ReducedDatums and permissions created for it
+                with transaction.atomic():
+                    dp.save()
+                    run_hook('data_product_post_upload', dp)
+                    if not queue_processing:
+                        reduced_data = run_data_processor(dp)
+                        assign_data_product_group_permissions(groups, dp, reduced_data)
+                if queue_processing:
+                    # Only queue the task once the DataProduct is committed and visible to the worker. This is
+                    # registered outside the block above so that a failed send is raised here, not while committing.
+                    transaction.on_commit(partial(self.send_for_processing, dp, group_ids))
             except InvalidFileFormatException as iffe:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
                 messages.error(
                     self.request,
                     'File format invalid for file {0} -- error was {1}'.format(str(dp), iffe)
                 )
             except Exception:
-                ReducedDatum.objects.filter(data_product=dp).delete()
-                dp.delete()
                 messages.error(self.request, 'There was a problem processing your file: {0}'.format(str(dp)))
+            else:
+                if queue_processing:
+                    queued_uploads.append(str(dp))
+                else:
+                    successful_uploads.append(str(dp))
         if successful_uploads:
             messages.success(
                 self.request,
-                'Successfully uploaded: {0}'.format('\n'.join([p for p in successful_uploads]))
+                'Successfully uploaded: {0}'.format('\n'.join(successful_uploads))
+            )
+        if queued_uploads:
+            messages.info(
+                self.request,
+                'Queued for processing: {0}'.format('\n'.join(queued_uploads))
             )
 
         return redirect(form.cleaned_data.get('referrer', '/'))
@@ -254,6 +281,20 @@ class DataProductDeleteView(Raise403PermissionRequiredMixin, DeleteView):
             return False
         return super(Raise403PermissionRequiredMixin, self).check_permissions(request)
 
+    def get_object(self, queryset=None):
+        """
+        Gets the ``DataProduct`` to be deleted. The object is cached on the view, as it is otherwise fetched once for
+        the permission check and again when handling the request.
+
+        :returns: ``DataProduct`` to be deleted
+        :rtype: DataProduct
+        """
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_data_product'):
+            self._data_product = super().get_object()
+        return self._data_product
+
     def get_success_url(self):
         """
         Gets the URL specified in the query params by "next" if it exists, otherwise returns the URL for home.
@@ -277,14 +318,14 @@ class DataProductDeleteView(Raise403PermissionRequiredMixin, DeleteView):
         :return: HttpResponseRedirect to the success URL.
         :rtype: HttpResponseRedirect
         """
-        # Fetch the DataProduct object
-        data_product = self.get_object()
+        # The DataProduct object has already been fetched by ``post``
+        data_product = self.object
 
         # Delete associated ReducedDatum objects
-        ReducedDatum.objects.filter(data_product=data_product).delete()
+        ReducedDatum.objects.filter(data_product_id=data_product.pk).delete()
 
-        # Delete the file reference.
-        data_product.data.delete()
+        # Delete the file reference. The model doesn't need to be saved, as it is about to be deleted.
+        data_product.data.delete(save=False)
         # Delete the `DataProduct` object from the database.
         data_product.delete()
 
@@ -321,11 +362,28 @@ class DataProductListView(FilterView):
         :rtype: QuerySet
         """
         if settings.TARGET_PERMISSIONS_ONLY:
-            return super().get_queryset().filter(
-                target__in=get_objects_for_user(self.request.user, 'tom_targets.view_target')
-            )
+            queryset = super().get_queryset().filter(target_id__in=self.get_viewable_target_ids())
         else:
-            return get_objects_for_user(self.request.user, 'tom_dataproducts.view_dataproduct')
+            queryset = get_objects_for_user(self.request.user, 'tom_dataproducts.view_dataproduct')
+        return queryset.select_related('target', 'observation_record__target').prefetch_related('group')
+
+    def get_viewable_target_ids(self):
+        """
+        Gets the IDs of the ``Target`` objects that the user has permission to view. The IDs are cached for five
+        minutes, and the cache is invalidated whenever targets, object permissions or group memberships change.
+
+        :returns: List of ``Target`` IDs
+        :rtype: list
+        """
+        cache_version = cache.get_or_set(VIEWABLE_TARGETS_CACHE_VERSION_KEY, lambda: uuid4().hex, None)
+        cache_key = f'dataproduct_list_viewable_targets:{cache_version}:{self.request.user.id}'
+        target_ids = cache.get(cache_key)
+        if target_ids is None:
+            target_ids = list(
+                get_objects_for_user(self.request.user, 'tom_targets.view_target').values_list('pk', flat=True)
+            )
+            cache.set(cache_key, target_ids, 300)
+        return target_ids
 
     def get_context_data(self, *args, **kwargs):
         """
@@ -352,24 +410,15 @@ class DataProductFeatureView(View):
         """
         product_id = kwargs.get('pk', None)
         product = DataProduct.objects.get(pk=product_id)
-        try:
-            current_featured = DataProduct.objects.filter(
-                featured=True,
-                data_product_type=product.data_product_type,
-                target=product.target
-            )
-            for featured_image in current_featured:
-                featured_image.featured = False
-                featured_image.save()
-                featured_image_cache_key = make_template_fragment_key(
-                    'featured_image',
-                    str(featured_image.target.id)
-                )
-                cache.delete(featured_image_cache_key)
-        except DataProduct.DoesNotExist:
-            pass
-        product.featured = True
-        product.save()
+        now = timezone.now()
+        DataProduct.objects.filter(
+            featured=True,
+            data_product_type=product.data_product_type,
+            target_id=product.target_id
+        ).update(featured=False, modified=now)
+        DataProduct.objects.filter(pk=product_id).update(featured=True, modified=now)
+        # Every unfeatured product belongs to the same target, so only that target's cached image needs clearing
+        cache.delete(make_template_fragment_key('featured_image', str(product.target_id)))
         return redirect(reverse(
             'tom_targets:detail',
             kwargs={'pk': request.GET.get('target_id')})
@@ -400,7 +449,8 @@ class DataShareView(FormView):
         """
         Method that handles the POST requests for sharing data.
         Handles Data Products and All the data of a type for a target as well as individual Reduced Datums.
-        Submit to Hermes, or Share with TOM (soon).
+        Submit to Hermes, or Share with TOM. If ``django_dramatiq`` is installed, the data is shared by a background
+        task rather than during the request.
         """
         data_share_form = DataShareForm(request.POST, request.FILES)
 
@@ -414,11 +464,17 @@ class DataShareView(FormView):
             selected_data = request.POST.getlist("share-box")
 
             # Check Destination
-            if 'HERMES' in share_destination.upper():
+            if 'django_dramatiq' in settings.INSTALLED_APPS:
+                # The Target instance in the form data can't be serialized into a task message, and isn't needed
+                task_form_data = {key: value for key, value in form_data.items() if key != 'target'}
+                share_data.send(share_destination, task_form_data, product_id, target_id, selected_data)
+                messages.info(request, f'Sharing data with {share_destination} has been queued.')
+            elif 'HERMES' in share_destination.upper():
                 response = share_data_with_hermes(share_destination, form_data, product_id, target_id, selected_data)
+                sharing_feedback_handler(response, self.request)
             else:
                 response = share_data_with_tom(share_destination, form_data, product_id, target_id, selected_data)
-            sharing_feedback_handler(response, self.request)
+                sharing_feedback_handler(response, self.request)
         return redirect(reverse('tom_targets:detail', kwargs={'pk': request.POST.get('target')}))
 
 
@@ -433,9 +489,7 @@ class DataProductGroupDetailView(DetailView):
         Handles the POST request for this view.
         """
         group = self.get_object()
-        for product in request.POST.getlist('products'):
-            group.dataproduct_set.remove(DataProduct.objects.get(pk=product))
-        group.save()
+        group.dataproduct_set.remove(*request.POST.getlist('products'))
         return redirect(reverse(
             'tom_dataproducts:group-detail',
             kwargs={'pk': group.id})
@@ -497,19 +551,19 @@ class UpdateReducedDataView(LoginRequiredMixin, RedirectView):
     def get(self, request, *args, **kwargs):
         """
         Method that handles the GET requests for this view. Calls the management command to update the reduced data and
-        adds a hint using the messages framework about automation.
+        adds a hint using the messages framework about automation. If ``django_dramatiq`` is installed, the update is
+        queued as a background task rather than run during the request.
         """
         # QueryDict is immutable, and we want to append the remaining params to the redirect URL
         query_params = request.GET.copy()
         target_id = query_params.pop('target_id', None)
-        out = StringIO()
-        if target_id:
-            if isinstance(target_id, list):
-                target_id = target_id[-1]
-            call_command('updatereduceddata', target_id=target_id, stdout=out)
+        if isinstance(target_id, list):
+            target_id = target_id[-1]
+        if 'django_dramatiq' in settings.INSTALLED_APPS:
+            update_reduced_data.send(target_id)
+            messages.info(request, 'Update of reduced data has been queued.')
         else:
-            call_command('updatereduceddata', stdout=out)
-        messages.info(request, out.getvalue())
+            messages.info(request, update_reduced_data(target_id))
         add_hint(request, mark_safe(
                           'Did you know updating observation statuses can be automated? Learn how in '
                           '<a href=https://tom-toolkit.readthedocs.io/en/stable/customization/automation.html>'
@@ -1,10 +1,9 @@
-import requests
-
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 
 from tom_targets.serializers import TargetSerializer
 from tom_dataproducts.sharing import get_destination_target
+from tom_dataproducts.sharing_session import SHARING_SESSION, SHARING_TIMEOUT
 
 
 def share_target_with_tom(share_destination, form_data, target_lists=()):
@@ -50,10 +49,12 @@ def share_target_with_tom(share_destination, form_data, target_lists=()):
         serialized_target['groups'] = []
         # Add target lists
         serialized_target['target_lists'] = target_dict_list
-        target_create_response = requests.post(targets_url, json=serialized_target, headers=headers, auth=auth)
+        target_create_response = SHARING_SESSION.post(targets_url, json=serialized_target, headers=headers, auth=auth,
+                                                      timeout=SHARING_TIMEOUT)
     else:
         # Add target to target lists if it already exists in destination TOM
         update_target_data = {'target_lists': target_dict_list}
         update_target_url = targets_url + f'{destination_target_id}/'
-        target_create_response = requests.patch(update_target_url, json=update_target_data, headers=headers, auth=auth)
+        target_create_response = SHARING_SESSION.patch(update_target_url, json=update_target_data, headers=headers,
+                                                       auth=auth, timeout=SHARING_TIMEOUT)
     return target_create_response